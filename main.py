@@ -1,17 +1,31 @@
 # -*- coding: utf-8 -*-
 import os
 import json
+import hashlib
 import time
 import subprocess
+import functools
+import heapq
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from io import BytesIO
 from zoneinfo import ZoneInfo
 from urllib.parse import quote, urlsplit, urlunsplit, parse_qsl, urlencode
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import yfinance as yf
-import feedparser
+from lxml import etree
+import numpy as np
 import pandas as pd
 
+try:
+    import orjson
+except ImportError:  # orjson yoksa stdlib json ile devam
+    orjson = None
+
 # =========================================================
 # TAIPO-BIST v3 PRO++ (2 Pencere + Saatlik Takip + Haber + Movers)
 # - AUTO: P1(10:00-10:10) + P2(10:30-10:40) kırılım
@@ -30,9 +44,17 @@ STATE_FILE = "state.json"
 SYMBOLS_FILE = "bist100.txt"
 
 TELEGRAM_API = f"https://api.telegram.org/bot{BOT_TOKEN}"
+_SEND_URL = f"{TELEGRAM_API}/sendMessage"
+_UPDATES_URL = f"{TELEGRAM_API}/getUpdates"
 
 PERSIST_STATE = os.getenv("PERSIST_STATE", "0").strip() == "1"
 
+# ---------- TELEGRAM HTTP ----------
+# COMMAND modunda long-poll (sunucu tarafı bekleme); AUTO modunda planlı push gecikmesin diye 0
+POLL_TIMEOUT_SEC = int(os.getenv("POLL_TIMEOUT_SEC", "25" if MODE == "COMMAND" else "0"))
+SEND_RETRY_DELAYS = (1.0,)  # bağlantı kurulamazsa 1 sn sonra 1 deneme daha
+TG_MSG_LIMIT = 4096  # sendMessage metin sınırı
+
 # ---------- PENCERE AYARLARI ----------
 P1_START_H, P1_START_M = 10, 0
 P1_END_H,   P1_END_M   = 10, 10
@@ -41,6 +63,7 @@ P2_START_H, P2_START_M = 10, 30
 P2_END_H,   P2_END_M   = 10, 40
 
 PICK_COUNT = 3
+PICK_LABELS = {"p1": "10:00–10:10 (P1)", "p2": "10:30–10:40 (P2)"}
 
 AUTO_BAND_STEPS = [
     (0.40, 0.90),
@@ -74,28 +97,84 @@ COMMAND_MAX_AGE_SEC = int(os.getenv("COMMAND_MAX_AGE_SEC", "1800"))  # 30 dk
 # ---------- HABER ----------
 NEWS_MAX_ITEMS = 3
 NEWS_STATE_KEY = "news_seen"
+NEWS_SEEN_MAX = 512  # son N başlık digest'i (halka)
+NEWS_HTTP_TIMEOUT_SEC = 15
+RSS_CACHE_KEY = "rss_cache"  # url -> {etag, modified}; state.json'da sadece doğrulayıcılar
+RSS_CACHE_FILE = "rss_cache.json"  # url -> {ts, entries}; commit'lenmez (gitignore)
+NEWS_CACHE_SEC = 300  # bu süre içinde feed'e hiç gidilmez
 
 # ---------- MOVERS / CACHE / ALERT ----------
 MOVERS_TOP_N = 5
 MOVERS_CACHE_SEC = 120
+DAILY_CACHE_FILE = "daily_cache.pkl"  # günlük barların diskteki kopyası (delta ile güncellenir)
+DAILY_BARS = 10
 ALERT_ABS_PCT = float(os.getenv("ALERT_ABS_PCT", "2.00"))
 ALERT_COOLDOWN_SEC = 6 * 60 * 60  # 6 saat
+ALERT_HYSTERESIS_PCT = float(os.getenv("ALERT_HYSTERESIS_PCT", "0.75"))  # aynı yönde en az bu kadar ek hareket
 
 # =========================================================
 # IO
 # =========================================================
+_LAST_STATE_DIGEST = None
+
+def _dump_bytes(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+
+def _loads(raw: bytes):
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
 def load_json(path: str, default):
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with open(path, "rb") as f:
+            return _loads(f.read())
     except Exception:
         return default
 
-def save_json(path: str, data):
+def _write_atomic(path: str, blob: bytes):
     tmp = path + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(blob)
+        while view:
+            view = view[os.write(fd, view):]
+        os.fsync(fd)  # rename'den önce içerik diske insin: yarım state.json kalmaz
+    finally:
+        os.close(fd)
     os.replace(tmp, path)
+    # rename'in kendisi de kalıcı olsun: dizin girdisini diske yaz
+    try:
+        dir_fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+    except OSError:
+        return  # dizin açılamayan platformlar (Windows)
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+def save_json(path: str, data):
+    _write_atomic(path, _dump_bytes(data))
+
+def _state_digest(blob: bytes) -> bytes:
+    return hashlib.blake2b(blob, digest_size=16).digest()
+
+def remember_state_digest(state):
+    # diskten okunan hal: değişmediyse tekrar yazılmaz
+    global _LAST_STATE_DIGEST
+    _LAST_STATE_DIGEST = _state_digest(_dump_bytes(state))
+
+def maybe_save_state(state) -> bool:
+    global _LAST_STATE_DIGEST
+    blob = _dump_bytes(state)
+    d = _state_digest(blob)
+    if d == _LAST_STATE_DIGEST:
+        return False
+    _write_atomic(STATE_FILE, blob)
+    _LAST_STATE_DIGEST = d
+    return True
 
 def ensure_files():
     if not os.path.exists(STATE_FILE):
@@ -106,7 +185,8 @@ def ensure_files():
                 "last_command_reply_ts": 0,
                 "last_id_reply_ts": 0,
                 "day": "",
-                NEWS_STATE_KEY: {},
+                NEWS_STATE_KEY: [],
+                RSS_CACHE_KEY: {},
                 "movers_cache": {"ts": 0, "data": None},
                 "alerts": {},
                 "eod_sent_day": "",
@@ -130,53 +210,120 @@ def _normalize_symbol(s: str) -> str:
         s = s + ".IS"
     return s
 
-def load_symbols():
-    if not os.path.exists(SYMBOLS_FILE):
-        return []
+# mtime anahtarlı: dosya değişmedikçe okuma/normalize tekrar yapılmaz
+@functools.lru_cache(maxsize=8)
+def _load_symbols_cached(mtime: float) -> tuple:
     syms = []
     with open(SYMBOLS_FILE, "r", encoding="utf-8") as f:
         for line in f:
             s = _normalize_symbol(line)
             if s:
                 syms.append(s)
-    return list(dict.fromkeys(syms))
+    return tuple(dict.fromkeys(syms))
+
+def load_symbols():
+    if not os.path.exists(SYMBOLS_FILE):
+        return []
+    return list(_load_symbols_cached(os.path.getmtime(SYMBOLS_FILE)))
 
 # =========================================================
 # TELEGRAM
 # =========================================================
+def _make_session(pool_maxsize: int, retry: Retry = None) -> requests.Session:
+    # varsayılan: GET'ler 429/5xx'te tekrar dener
+    if retry is None:
+        retry = Retry(total=2, backoff_factor=0.2, status_forcelist=[429, 500, 502, 503, 504])
+    s = requests.Session()
+    s.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=retry))
+    return s
+
+# Ayrı havuzlar: 25 sn bekleyen getUpdates, planlı push'un bağlantısını bloklamasın
+POLL_SESSION = _make_session(pool_maxsize=2)
+# sendMessage (POST) yalnızca mesajın gitmediği kesin durumlarda tekrar denenir: bağlantı kurulamadı
+# ya da Telegram 429 ile reddetti (Retry-After kadar beklenir); ReadTimeout/5xx'te çift mesaj riski var
+_SEND_RETRY = Retry(
+    total=2, connect=2, read=0, status=1, other=0,
+    status_forcelist=[429], allowed_methods=frozenset({"POST"}),
+    respect_retry_after_header=True, raise_on_status=False, backoff_factor=0.2,
+)
+API_SESSION = _make_session(pool_maxsize=8, retry=_SEND_RETRY)
+
+def _call_with_retry(fn, *a, **kw):
+    for delay in SEND_RETRY_DELAYS:
+        try:
+            return fn(*a, **kw)
+        except requests.ConnectionError:  # ConnectTimeout dahil; ReadTimeout'ta mesaj gitmiş olabilir
+            time.sleep(delay)
+    return fn(*a, **kw)
+
+_HTML_ESCAPE = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
+
 def _escape_html(s: str) -> str:
-    return (s or "").replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    return (s or "").translate(_HTML_ESCAPE)
+
+def _split_message(text: str, limit: int = TG_MSG_LIMIT) -> list:
+    # boş satırdan (blok sınırı) böl; HTML etiketleri satır içinde kaldığı için bozulmaz
+    if len(text) <= limit:
+        return [text]
+    chunks = []
+    cur = ""
+    for block in text.split("\n\n"):
+        cand = f"{cur}\n\n{block}" if cur else block
+        if len(cand) <= limit:
+            cur = cand
+            continue
+        if cur:
+            chunks.append(cur)
+        # tek blok bile sığmıyorsa satır sonundan kes
+        while len(block) > limit:
+            cut = block.rfind("\n", 0, limit)
+            if cut <= 0:
+                cut = limit
+            chunks.append(block[:cut])
+            block = block[cut:].lstrip("\n")
+        cur = block
+    if cur:
+        chunks.append(cur)
+    return chunks
 
 def send_message(text: str, chat_id: str = None) -> bool:
     if not chat_id:
         chat_id = TARGET_CHAT_ID
     if not BOT_TOKEN or not chat_id:
         return False
-    payload = {
-        "chat_id": chat_id,
-        "text": text,
-        "parse_mode": "HTML",
-        "disable_web_page_preview": True,
-    }
-    try:
-        r = requests.post(f"{TELEGRAM_API}/sendMessage", json=payload, timeout=25)
-        return r.status_code == 200
-    except Exception:
-        return False
+    ok = True
+    for chunk in _split_message(text):
+        payload = {
+            "chat_id": chat_id,
+            "text": chunk,
+            "parse_mode": "HTML",
+            "disable_web_page_preview": True,
+        }
+        try:
+            r = _call_with_retry(API_SESSION.post, _SEND_URL, json=payload, timeout=25)
+            ok = ok and r.status_code == 200
+        except Exception:
+            ok = False
+    return ok
 
 def get_updates(offset: int):
     if not BOT_TOKEN:
         return []
-    params = {"timeout": 0, "offset": offset}
+    params = {
+        "timeout": POLL_TIMEOUT_SEC,
+        "offset": offset,
+        "allowed_updates": json.dumps(["message"]),  # düzenlemeler komutu tekrar tetiklemesin
+    }
     try:
-        r = requests.get(f"{TELEGRAM_API}/getUpdates", params=params, timeout=25)
-        data = r.json()
+        # soket, Telegram'ın sunucu tarafı beklemesinden uzun yaşamalı
+        r = POLL_SESSION.get(_UPDATES_URL, params=params, timeout=max(25, POLL_TIMEOUT_SEC + 5))
+        data = _loads(r.content)  # bytes'tan doğrudan: ara str decode yok
         return data.get("result", []) if data.get("ok") else []
     except Exception:
         return []
 
 def extract_message(update: dict):
-    return update.get("message") or update.get("edited_message")
+    return update.get("message")
 
 def msg_text(msg: dict):
     return (msg.get("text") or "").strip()
@@ -189,52 +336,65 @@ def msg_chat_title(msg: dict):
     chat = msg.get("chat") or {}
     return (chat.get("title") or chat.get("username") or "").strip()
 
+try:
+    _TARGET_CHAT_INT = int(TARGET_CHAT_ID)  # Telegram chat.id JSON'da int gelir
+except ValueError:
+    _TARGET_CHAT_INT = None  # boş ya da @kanal biçimi
+
 def is_target_chat(msg: dict):
-    cid = msg_chat_id(msg)
-    return (not TARGET_CHAT_ID) or (cid == str(TARGET_CHAT_ID))
+    if not TARGET_CHAT_ID:
+        return True
+    cid = (msg.get("chat") or {}).get("id")
+    if _TARGET_CHAT_INT is not None:
+        return cid == _TARGET_CHAT_INT
+    return str(cid) == TARGET_CHAT_ID
 
-def is_fresh_command(msg: dict) -> bool:
+def is_fresh_command(msg: dict, now_ts: int = None) -> bool:
     d = msg.get("date")
     if not isinstance(d, int):
         return True
-    return (int(time.time()) - d) <= COMMAND_MAX_AGE_SEC
+    return ((now_ts or int(time.time())) - d) <= COMMAND_MAX_AGE_SEC
 
 # =========================================================
 # TIME HELPERS
 # =========================================================
-def today_str_tr():
-    return datetime.now(TZ).strftime("%Y-%m-%d")
+# n verilirse çağıran tarafın tek "şimdi"si kullanılır: aynı tick içinde kontroller tutarlı kalır
+def today_str_tr(n: datetime = None):
+    return (n or datetime.now(TZ)).strftime("%Y-%m-%d")
 
-def now_str_tr():
-    return datetime.now(TZ).strftime("%d.%m.%Y %H:%M")
+def now_str_tr(n: datetime = None):
+    return (n or datetime.now(TZ)).strftime("%d.%m.%Y %H:%M")
 
-def now_key_minute():
-    return datetime.now(TZ).strftime("%Y-%m-%d %H:%M")
+def now_key_minute(n: datetime = None):
+    return (n or datetime.now(TZ)).strftime("%Y-%m-%d %H:%M")
 
-def now_key_hour():
-    return datetime.now(TZ).strftime("%Y-%m-%d %H")
+def now_key_hour(n: datetime = None):
+    return (n or datetime.now(TZ)).strftime("%Y-%m-%d %H")
 
-def is_weekday_tr():
-    return datetime.now(TZ).weekday() < 5
+def is_weekday_tr(n: datetime = None):
+    return (n or datetime.now(TZ)).weekday() < 5
 
 def _minutes(h: int, m: int) -> int:
     return h * 60 + m
 
-def is_in_window(start_h, start_m, end_h, end_m) -> bool:
-    n = datetime.now(TZ)
+def is_in_window(start_h, start_m, end_h, end_m, n: datetime = None) -> bool:
+    n = n or datetime.now(TZ)
     cur = _minutes(n.hour, n.minute)
     lo = _minutes(start_h, start_m)
     hi = _minutes(end_h, end_m)
     return lo <= cur <= hi
 
-def in_market_session():
-    if not is_weekday_tr():
+def in_market_session(n: datetime = None):
+    n = n or datetime.now(TZ)
+    if not is_weekday_tr(n):
         return False
-    return is_in_window(SESSION_START_H, SESSION_START_M, SESSION_END_H, SESSION_END_M)
+    return is_in_window(SESSION_START_H, SESSION_START_M, SESSION_END_H, SESSION_END_M, n)
 
-def ensure_today_state(state):
+def ensure_today_state(state, n: datetime = None):
     if NEWS_STATE_KEY not in state:
-        state[NEWS_STATE_KEY] = {}
+        state[NEWS_STATE_KEY] = []
+    if RSS_CACHE_KEY not in state:
+        state[RSS_CACHE_KEY] = {}
     if "movers_cache" not in state:
         state["movers_cache"] = {"ts": 0, "data": None}
     if "alerts" not in state:
@@ -253,8 +413,9 @@ def ensure_today_state(state):
     if "last_track_sent_key" not in state:
         state["last_track_sent_key"] = ""
 
-    if state.get("day") != today_str_tr():
-        state["day"] = today_str_tr()
+    today = today_str_tr(n)
+    if state.get("day") != today:
+        state["day"] = today
         state["movers_cache"] = {"ts": 0, "data": None}
         state["alerts"] = {}
         state["eod_sent_day"] = ""
@@ -265,80 +426,101 @@ def ensure_today_state(state):
         state["last_track_sent_key"] = ""
     return state
 
-def is_track_time_now():
-    if not is_weekday_tr():
-        return False
-    n = datetime.now(TZ)
-    if n.hour not in TRACK_HOURS_TR:
-        return False
-    return TRACK_MIN_START <= n.minute <= TRACK_MIN_END
+def _build_schedule():
+    # (saat, dakika) -> olay; pencereler önceden açılır, tick başına tek dict lookup
+    table = {}
 
-def should_send_track_now(state):
-    key = now_key_hour()  # saat bazında 1 kere
-    return state.get("last_track_sent_key", "") != key
+    def add(event, start_h, start_m, end_h, end_m):
+        for t in range(_minutes(start_h, start_m), _minutes(end_h, end_m) + 1):
+            table[divmod(t, 60)] = event
 
-def is_eod_time_now():
-    if not is_weekday_tr():
-        return False
-    n = datetime.now(TZ)
-    if n.hour != EOD_REPORT_HOUR:
-        return False
-    return EOD_MIN_START <= n.minute <= EOD_MIN_END
+    add("p1", P1_START_H, P1_START_M, P1_END_H, P1_END_M)
+    add("p2", P2_START_H, P2_START_M, P2_END_H, P2_END_M)
+    for h in TRACK_HOURS_TR:
+        add("track", h, TRACK_MIN_START, h, TRACK_MIN_END)
+    add("eod", EOD_REPORT_HOUR, EOD_MIN_START, EOD_REPORT_HOUR, EOD_MIN_END)
+    return table
+
+SCHEDULE = _build_schedule()
+
+def current_event(n: datetime = None):
+    n = n or datetime.now(TZ)
+    if n.weekday() >= 5:
+        return None
+    return SCHEDULE.get((n.hour, n.minute))
+
+def should_send_track_now(state, n: datetime = None):
+    key = now_key_hour(n)  # saat bazında 1 kere
+    return state.get("last_track_sent_key", "") != key
 
 # =========================================================
 # DATA
 # =========================================================
-def fetch_quote(symbol: str):
-    try:
-        t = yf.Ticker(symbol)
-        fi = getattr(t, "fast_info", None)
-        price = None
-        prev_close = None
-
-        if fi:
-            price = fi.get("last_price") or fi.get("lastPrice")
-            prev_close = fi.get("previous_close") or fi.get("previousClose")
-
-        if price is None or prev_close is None:
-            hist2 = t.history(period="2d", interval="1d")
-            if hist2 is not None and len(hist2) >= 2:
-                prev_close = float(hist2["Close"].iloc[-2])
-                price = float(hist2["Close"].iloc[-1])
-
-        if price is None or prev_close in (None, 0):
-            return None
-
-        change_pct = ((float(price) - float(prev_close)) / float(prev_close)) * 100.0
-        return {
-            "symbol": symbol,
-            "price": round(float(price), 2),
-            "prev_close": round(float(prev_close), 2),
-            "change_pct": round(float(change_pct), 2),
-        }
-    except Exception:
-        return None
+_DAILY_CACHE = {"ts": 0, "key": (), "df": None}
+
+def _quote_dict(symbol: str, price, prev_close) -> dict:
+    change_pct = ((float(price) - float(prev_close)) / float(prev_close)) * 100.0
+    return {
+        "symbol": symbol,
+        "price": round(float(price), 2),
+        "prev_close": round(float(prev_close), 2),
+        "change_pct": round(float(change_pct), 2),
+    }
 
-def scan_quotes_bulk_intraday(symbols):
+def fetch_quotes_batch(symbols):
+    # takip listesi (3-6 sembol) tek istekte: {sym: quote}
     if not symbols:
-        return []
-
+        return {}
     try:
-        intraday = yf.download(
+        df = yf.download(
             tickers=symbols,
-            period="1d",
-            interval="1m",
+            period="2d",
+            interval="1d",
             group_by="ticker",
             threads=True,
             auto_adjust=False,
             progress=False,
         )
     except Exception:
-        intraday = None
+        return {}
+
+    close = _field_frame(df, "Close")
+    if close is None:
+        return {}
 
+    # Series/iloc yerine ham float64 matris: sütun başına NaN süzme numpy'da
+    cols = {sym: i for i, sym in enumerate(close.columns)}
+    arr = close.to_numpy(dtype=np.float64)
+    out = {}
+    for sym in symbols:
+        i = cols.get(sym)
+        if i is None:
+            continue
+        c = arr[:, i]
+        c = c[~np.isnan(c)]
+        if len(c) < 2 or c[-2] == 0:
+            continue
+        out[sym] = _quote_dict(sym, c[-1], c[-2])
+    return out
+
+def _field_frame(df, field: str):
+    # group_by="ticker" çerçevesinden tek alan: sütunlar = semboller
+    if not isinstance(df, pd.DataFrame) or df.empty or not isinstance(df.columns, pd.MultiIndex):
+        return None
+    if field not in df.columns.get_level_values(1):
+        return None
+    return df.xs(field, level=1, axis=1)
+
+def _valid_rank(df, cols):
+    # sembol bazında dropna() eşdeğeri: satırın tüm alanları dolu mu + sondan kaçıncı geçerli bar
+    valid = df.notna().T.groupby(level=0).all().T.reindex(columns=cols, fill_value=False)
+    return valid, valid[::-1].cumsum()[::-1]
+
+def _yf_daily(symbols, period: str):
     try:
-        daily = yf.download(
+        return yf.download(
             tickers=symbols,
-            period="10d",
+            period=period,
             interval="1d",
             group_by="ticker",
             threads=True,
@@ -346,136 +528,190 @@ def scan_quotes_bulk_intraday(symbols):
             progress=False,
         )
     except Exception:
-        daily = None
-
-    out = []
-    for sym in symbols:
-        try:
-            last_price = None
-            last_vol = None
-
-            if isinstance(intraday, pd.DataFrame) and not intraday.empty:
-                if isinstance(intraday.columns, pd.MultiIndex):
-                    if sym in intraday.columns.get_level_values(0):
-                        df_i = intraday[sym].dropna()
-                        if not df_i.empty:
-                            last_price = float(df_i["Close"].iloc[-1])
-                            if "Volume" in df_i.columns:
-                                last_vol = float(df_i["Volume"].iloc[-1])
-
-            prev_close = None
-            avg_vol = None
-
-            if isinstance(daily, pd.DataFrame) and not daily.empty:
-                if isinstance(daily.columns, pd.MultiIndex):
-                    if sym in daily.columns.get_level_values(0):
-                        df_d = daily[sym].dropna()
-                        if len(df_d) >= 2 and "Close" in df_d.columns:
-                            prev_close = float(df_d["Close"].iloc[-2])
-                        if "Volume" in df_d.columns and len(df_d) >= 5:
-                            avg_vol = float(df_d["Volume"].tail(10).mean())
-
-            if last_price is None or prev_close in (None, 0):
-                continue
+        return None
 
-            change_pct = ((last_price - prev_close) / prev_close) * 100.0
-            q = {
-                "symbol": sym,
-                "price": round(float(last_price), 2),
-                "prev_close": round(float(prev_close), 2),
-                "change_pct": round(float(change_pct), 2),
-            }
+def load_daily_cache(symbols):
+    try:
+        df = pd.read_pickle(DAILY_CACHE_FILE)
+    except Exception:
+        return None
+    if not isinstance(df, pd.DataFrame) or df.empty or not isinstance(df.columns, pd.MultiIndex):
+        return None
+    if not set(symbols) <= set(df.columns.get_level_values(0)):
+        return None
+    return df
 
-            if last_vol is not None and avg_vol and avg_vol > 0:
-                q["vol_ratio"] = round(float(last_vol / avg_vol), 2)
+def save_daily_cache(df):
+    tmp = DAILY_CACHE_FILE + ".tmp"
+    try:
+        df.to_pickle(tmp)
+        os.replace(tmp, DAILY_CACHE_FILE)
+    except Exception:
+        pass
 
-            out.append(q)
-        except Exception:
-            continue
+def download_daily(symbols):
+    # 10 günlük bar: kırılım (prev_close/avg_vol) ve movers (son 5 gün) aynı çerçeveyi kullanır
+    now_ts = int(time.time())
+    key = tuple(symbols)
+    if (
+        _DAILY_CACHE["df"] is not None
+        and _DAILY_CACHE["key"] == key
+        and (now_ts - _DAILY_CACHE["ts"]) <= MOVERS_CACHE_SEC
+    ):
+        return _DAILY_CACHE["df"]
+
+    daily = None
+    cached = load_daily_cache(symbols)
+    if cached is not None:
+        if (now_ts - int(os.path.getmtime(DAILY_CACHE_FILE))) <= MOVERS_CACHE_SEC:
+            daily = cached
+        else:
+            # sadece son 2 bar çekilir; diskteki seriyle örtüşmüyorsa tam indirmeye düşer
+            delta = _yf_daily(symbols, "2d")
+            if isinstance(delta, pd.DataFrame) and not delta.empty and delta.index.min() <= cached.index.max():
+                # yeni değer yalnızca doluysa yazılır: o tur çekilemeyen sembolün diskteki barları NaN'la ezilmez
+                daily = delta.combine_first(cached).sort_index().tail(DAILY_BARS)
+                save_daily_cache(daily)
+
+    if daily is None:
+        daily = _yf_daily(symbols, f"{DAILY_BARS}d")
+        if not isinstance(daily, pd.DataFrame) or daily.empty:
+            return None
+        save_daily_cache(daily)
 
-    return out
+    _DAILY_CACHE.update(ts=now_ts, key=key, df=daily)
+    return daily
 
-def scan_daily_movers(symbols):
+def scan_quotes_bulk_intraday(symbols):
     if not symbols:
         return []
+
     try:
-        daily2 = yf.download(
+        intraday = yf.download(
             tickers=symbols,
-            period="5d",
-            interval="1d",
+            period="1d",
+            interval="1m",
             group_by="ticker",
             threads=True,
             auto_adjust=False,
             progress=False,
         )
     except Exception:
-        daily2 = None
+        intraday = None
+
+    daily = download_daily(symbols)
+
+    close_i = _field_frame(intraday, "Close")
+    close_d = _field_frame(daily, "Close")
+    if close_i is None or close_d is None:
+        return []
+
+    # tüm semboller tek geçişte: sembol bazında son/sondan ikinci geçerli bar (dropna() eşdeğeri)
+    valid_i, rank_i = _valid_rank(intraday, close_i.columns)
+    valid_d, rank_d = _valid_rank(daily, close_d.columns)
+    last_price = close_i.where(valid_i & (rank_i == 1)).max()
+    prev_close = close_d.where(valid_d & (rank_d == 2)).max()
+    change_pct = (last_price - prev_close) / prev_close * 100.0
+
+    vol_ratio = None
+    vol_i = _field_frame(intraday, "Volume")
+    vol_d = _field_frame(daily, "Volume")
+    if vol_i is not None and vol_d is not None:
+        avg_vol = vol_d.where(valid_d & (rank_d <= 10)).mean().where(valid_d.sum() >= 5)
+        last_vol = vol_i.where(valid_i & (rank_i == 1)).max()
+        vol_ratio = last_vol / avg_vol.where(avg_vol > 0)
 
     out = []
     for sym in symbols:
-        try:
-            df = None
-            if isinstance(daily2, pd.DataFrame) and not daily2.empty:
-                if isinstance(daily2.columns, pd.MultiIndex):
-                    if sym in daily2.columns.get_level_values(0):
-                        df = daily2[sym].dropna()
+        lp = last_price.get(sym)
+        pc = prev_close.get(sym)
+        if pd.isna(lp) or pd.isna(pc) or pc == 0:
+            continue
+        q = {
+            "symbol": sym,
+            "price": round(float(lp), 2),
+            "prev_close": round(float(pc), 2),
+            "change_pct": round(float(change_pct[sym]), 2),
+        }
+        if vol_ratio is not None and pd.notna(vol_ratio.get(sym)):
+            q["vol_ratio"] = round(float(vol_ratio[sym]), 2)
+        out.append(q)
 
-            if df is None or df.empty or "Close" not in df.columns:
-                continue
-            if len(df) < 2:
-                continue
+    return out
 
-            prev_close = float(df["Close"].iloc[-2])
-            last_close = float(df["Close"].iloc[-1])
-            if prev_close == 0:
-                continue
+def scan_daily_movers(symbols):
+    if not symbols:
+        return []
+    daily = download_daily(symbols)
+    if not isinstance(daily, pd.DataFrame) or daily.empty or not isinstance(daily.columns, pd.MultiIndex):
+        return []
 
-            change_pct = ((last_close - prev_close) / prev_close) * 100.0
-
-            vol_ratio = None
-            if "Volume" in df.columns and len(df) >= 3:
-                last_vol = float(df["Volume"].iloc[-1])
-                avg_vol = float(df["Volume"].tail(5).mean()) if len(df) >= 5 else float(df["Volume"].mean())
-                if avg_vol > 0:
-                    vol_ratio = last_vol / avg_vol
-
-            score = float(change_pct)
-            if vol_ratio is not None:
-                score += float(vol_ratio) * 0.35
-
-            out.append(
-                {
-                    "symbol": sym,
-                    "price": round(last_close, 2),
-                    "change_pct": round(change_pct, 2),
-                    "vol_ratio": round(vol_ratio, 2) if vol_ratio is not None else None,
-                    "score": round(score, 2),
-                }
-            )
-        except Exception:
+    daily2 = daily.iloc[-5:]
+    close = _field_frame(daily2, "Close")
+    if close is None:
+        return []
+    vol = _field_frame(daily2, "Volume")
+
+    valid, rank = _valid_rank(daily2, close.columns)
+    n_bars = valid.sum()
+
+    last_close = close.where(valid & (rank == 1)).max()
+    prev_close = close.where(valid & (rank == 2)).max()
+    change_pct = (last_close - prev_close) / prev_close * 100.0
+
+    if vol is not None:
+        last_vol = vol.where(valid & (rank == 1)).max()
+        avg_vol = vol.where(valid).mean()
+        vol_ratio = (last_vol / avg_vol).where((n_bars >= 3) & (avg_vol > 0))
+    else:
+        vol_ratio = pd.Series(float("nan"), index=close.columns)
+    score = change_pct + vol_ratio.fillna(0.0) * 0.35
+
+    out = []
+    for sym in symbols:
+        if sym not in close.columns or n_bars[sym] < 2:
+            continue
+        pc = prev_close[sym]
+        if pd.isna(pc) or pc == 0:
             continue
+        vr = vol_ratio[sym]
+        out.append(
+            {
+                "symbol": sym,
+                "price": round(float(last_close[sym]), 2),
+                "change_pct": round(float(change_pct[sym]), 2),
+                "vol_ratio": round(float(vr), 2) if pd.notna(vr) else None,
+                "score": round(float(score[sym]), 2),
+            }
+        )
     return out
 
 def pick_breakouts_with_auto_band(quotes, n=3):
-    quotes_pos = [q for q in quotes if float(q.get("change_pct", 0)) > 0]
+    if not quotes:
+        return [], None
+
+    cp = np.fromiter((q.get("change_pct", 0.0) or 0.0 for q in quotes), dtype=np.float64, count=len(quotes))
+    vr = np.fromiter((q.get("vol_ratio", 0.0) or 0.0 for q in quotes), dtype=np.float64, count=len(quotes))
+    score = vr * 10.0 + cp
+    pos = cp > 0
 
-    def _rank_score(q: dict) -> float:
-        vr = float(q.get("vol_ratio", 0.0) or 0.0)
-        cp = float(q.get("change_pct", 0.0) or 0.0)
-        return vr * 10.0 + cp
+    # tek sıralama; her bant bu sırayı maskeyle süzer (eşit skorda giriş sırası korunur)
+    order = np.argsort(-score, kind="stable")
+
+    def _top_n(mask):
+        top = order[mask[order]][:n]
+        if len(top) < n:
+            return None
+        return [quotes[i] for i in top]
 
     for lo, hi in AUTO_BAND_STEPS:
-        pool = [q for q in quotes_pos if lo <= float(q["change_pct"]) <= hi]
-        if not pool:
-            continue
-        pool_sorted = sorted(pool, key=_rank_score, reverse=True)
-        if len(pool_sorted) >= n:
-            return pool_sorted[:n], (lo, hi)
+        picks = _top_n(pos & (cp >= lo) & (cp <= hi))
+        if picks:
+            return picks, (lo, hi)
 
-    fallback = [q for q in quotes_pos if 0.0 <= float(q.get("change_pct", 0)) <= 3.0]
-    fallback = sorted(fallback, key=_rank_score, reverse=True)[:n]
-    if len(fallback) == n:
-        return fallback, (0.0, 3.0)
+    picks = _top_n(pos & (cp <= 3.0))
+    if picks:
+        return picks, (0.0, 3.0)
 
     return [], None
 
@@ -486,33 +722,100 @@ def _google_news_rss_url(query: str) -> str:
     q = quote(query)
     return f"https://news.google.com/rss/search?q={q}&hl=tr&gl=TR&ceid=TR:tr"
 
+_NEWS_QUERIES = (
+    '"Borsa İstanbul" OR BIST OR "BIST 100"',
+    'KAP OR "Kamuyu Aydınlatma Platformu"',
+    'SPK OR "Sermaye Piyasası Kurulu"',
+    'temettü OR bedelsiz OR "pay geri alım" OR "sermaye artırımı"',
+)
+_NEWS_QUERY_URLS = tuple(_google_news_rss_url(q) for q in _NEWS_QUERIES)
+_BANNED_QUERY_KEYS = frozenset({"utm_source", "utm_medium", "utm_campaign", "utm_term", "utm_content", "oc"})
+
 def normalize_url(u: str) -> str:
     try:
         parts = urlsplit(u)
         q = parse_qsl(parts.query, keep_blank_values=True)
-        banned = {"utm_source", "utm_medium", "utm_campaign", "utm_term", "utm_content", "oc"}
-        q2 = [(k, v) for (k, v) in q if k not in banned]
+        q2 = [(k, v) for (k, v) in q if k not in _BANNED_QUERY_KEYS]
         new_query = urlencode(q2, doseq=True)
         return urlunsplit((parts.scheme, parts.netloc, parts.path, new_query, parts.fragment))
     except Exception:
         return u
 
-def fetch_bist_news_items():
-    queries = [
-        '"Borsa İstanbul" OR BIST OR "BIST 100"',
-        'KAP OR "Kamuyu Aydınlatma Platformu"',
-        'SPK OR "Sermaye Piyasası Kurulu"',
-        'temettü OR bedelsiz OR "pay geri alım" OR "sermaye artırımı"',
-    ]
+NEWS_SESSION = _make_session(pool_maxsize=4)
+
+def _feed_is_fresh(cache: dict, now_ts: int) -> bool:
+    return "entries" in cache and (now_ts - int(cache.get("ts", 0))) < NEWS_CACHE_SEC
+
+def _parse_rss_items(content: bytes, limit: int) -> list:
+    # sadece <item><title>/<link> lazım: genel amaçlı feedparser yerine akış halinde ilk `limit` item
+    entries = []
+    seen = 0
+    for _, item in etree.iterparse(BytesIO(content), events=("end",), tag="item"):
+        title = (item.findtext("title") or "").strip()
+        link = (item.findtext("link") or "").strip()
+        item.clear()
+        if title and link:
+            entries.append({"title": title, "link": normalize_url(link)})
+        seen += 1
+        if seen >= limit:
+            break
+    return entries
+
+def _fetch_feed(url: str, validators: dict, cache: dict):
+    # (doğrulayıcılar, {ts, entries}) döner
+    now_ts = int(time.time())
+    # koşullu GET: 304 gelirse gövde inmez, önceki entries kullanılır
+    # elde entries yoksa (yeni process/yan dosya yok) koşulsuz GET: 304 boş cevapla kalmayalım
+    headers = {}
+    if "entries" in cache:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("modified"):
+            headers["If-Modified-Since"] = validators["modified"]
+    try:
+        r = NEWS_SESSION.get(url, headers=headers, timeout=NEWS_HTTP_TIMEOUT_SEC)
+        if r.status_code == 304 and headers:
+            return validators, {**cache, "ts": now_ts}
+        r.raise_for_status()
+        entries = _parse_rss_items(r.content, 10)
+    except Exception:
+        return validators, cache
+
+    return (
+        {"etag": r.headers.get("ETag", ""), "modified": r.headers.get("Last-Modified", "")},
+        {"ts": now_ts, "entries": entries},
+    )
+
+def fetch_bist_news_items(state):
+    urls = _NEWS_QUERY_URLS
+    validators = state.get(RSS_CACHE_KEY, {}) or {}
+    rss_cache = load_json(RSS_CACHE_FILE, {})
+    if not isinstance(rss_cache, dict):
+        rss_cache = {}
+    now_ts = int(time.time())
+
+    stale = [u for u in urls if not _feed_is_fresh(rss_cache.get(u, {}), now_ts)]
+    if stale:
+        # sadece bayat feed'ler havuza gider, paralel (I/O-bound)
+        with ThreadPoolExecutor(max_workers=len(stale)) as ex:
+            results = ex.map(lambda u: _fetch_feed(u, validators.get(u, {}), rss_cache.get(u, {})), stale)
+            for u, (v, c) in zip(stale, results):
+                validators[u] = v
+                rss_cache[u] = c
+        try:
+            save_json(RSS_CACHE_FILE, {u: rss_cache.get(u, {}) for u in urls})
+        except Exception:
+            pass
+
+    # state.json her AUTO turunda git'e gider: entries değil sadece etag/modified
+    state[RSS_CACHE_KEY] = {
+        u: {"etag": validators.get(u, {}).get("etag", ""), "modified": validators.get(u, {}).get("modified", "")}
+        for u in urls
+    }
+
     items = []
-    for q in queries:
-        url = _google_news_rss_url(q)
-        feed = feedparser.parse(url)
-        for e in feed.entries[:10]:
-            title = (e.get("title") or "").strip()
-            link = (e.get("link") or "").strip()
-            if title and link:
-                items.append({"title": title, "link": normalize_url(link)})
+    for u in urls:
+        items.extend(rss_cache.get(u, {}).get("entries", []))
 
     uniq = []
     seen_titles = set()
@@ -522,28 +825,45 @@ def fetch_bist_news_items():
             continue
         seen_titles.add(key)
         uniq.append(it)
-    return uniq
+    return state, uniq
+
+def _hash_text(s: str) -> str:
+    # process'ler arası sabit (hash() her restart'ta değişir), 16 karakter
+    return hashlib.blake2b(s.encode("utf-8"), digest_size=8).hexdigest()
+
+def _news_key(title: str) -> str:
+    return _hash_text(title.strip().lower())
+
+def _lru_set(d: OrderedDict, k, v, maxlen: int):
+    d[k] = v
+    d.move_to_end(k)
+    while len(d) > maxlen:
+        d.popitem(last=False)
+
+def _load_news_seen(state) -> OrderedDict:
+    raw = state.get(NEWS_STATE_KEY) or []
+    if isinstance(raw, dict):
+        # eski biçim: küçük harf başlık -> ts; her anahtar digest'e çevrilir
+        raw = [[_news_key(k), v] for k, v in sorted(raw.items(), key=lambda kv: int(kv[1]))]
+    return OrderedDict((k, int(v)) for k, v in raw)
 
 def pick_new_news_for_message(state, items, max_items=NEWS_MAX_ITEMS):
     now_ts = int(time.time())
-    seen_map = state.get(NEWS_STATE_KEY, {}) or {}
-
-    cutoff = now_ts - 7 * 24 * 3600
-    seen_map = {k: v for k, v in seen_map.items() if int(v) >= cutoff}
+    seen = _load_news_seen(state)
 
     selected = []
     for it in items:
-        key = it["title"].lower()
-        if key in seen_map:
+        key = _news_key(it["title"])
+        if key in seen:
+            # hâlâ feed'de: halkanın sonuna taşı ki erken düşmesin
+            seen.move_to_end(key)
             continue
-        selected.append(it)
         if len(selected) >= max_items:
-            break
-
-    for it in selected:
-        seen_map[it["title"].lower()] = now_ts
+            continue
+        selected.append(it)
+        _lru_set(seen, key, now_ts, NEWS_SEEN_MAX)
 
-    state[NEWS_STATE_KEY] = seen_map
+    state[NEWS_STATE_KEY] = [[k, v] for k, v in seen.items()]
     return state, selected
 
 def build_news_block(selected_items):
@@ -558,7 +878,7 @@ def build_news_block(selected_items):
 
 def append_news_to_text(state, base_text: str):
     try:
-        items = fetch_bist_news_items()
+        state, items = fetch_bist_news_items(state)
         state, selected = pick_new_news_for_message(state, items, NEWS_MAX_ITEMS)
         news_block = build_news_block(selected)
         if not news_block:
@@ -570,130 +890,187 @@ def append_news_to_text(state, base_text: str):
 # =========================================================
 # FORMAT
 # =========================================================
+# sembol evreni sınırlı (BIST100): satır başına replace taraması tekrarlanmasın
+@functools.lru_cache(maxsize=256)
 def clean_sym(sym: str):
-    return sym.replace(".IS", "")
-
-def trend_emoji(pct: float):
-    return "🟢⬆️" if pct >= 0 else "🔴⬇️"
+    return sym[:-3] if sym.endswith(".IS") else sym
+
+# [pct >= 0] ile indekslenir; yüzde metni satırlarda {pct:+.2f}% olarak basılır
+_TREND = ("🔴⬇️", "🟢⬆️")
+
+_BOX_TOP = "┌──────────────────────────────"
+_BOX_BOTTOM = "└──────────────────────────────"
+
+_MOVERS_TMPL = (
+    _BOX_TOP + "\n"
+    "│ 📌 <b>MARKET ÖZET</b>\n"
+    "│ 🟢 Artıda: <b>{pos}</b>  🔴 Ekside: <b>{neg}</b>  ⚪️ Yatay: <b>{flat}</b>\n"
+    + _BOX_BOTTOM + "\n"
+    "\n"
+    "📈 <b>En Çok Yükselen 5</b>\n"
+    "{top_lines}\n"
+    "\n"
+    "📉 <b>En Çok Düşen 5</b>\n"
+    "{bottom_lines}"
+)
+
+_PICK_TMPL = (
+    "✅ <b>{label} KIRILIM</b> – TAIPO BIST v3 PRO++\n"
+    "\n"
+    + _BOX_TOP + "\n"
+    "│ 📊 <b>KIRILIM RADAR</b>\n"
+    "│ {picked_at}\n"
+    + _BOX_BOTTOM + "\n"
+    "\n"
+    "🎯 <b>Band (auto):</b> {lo:.2f}% – {hi:.2f}%\n"
+    "\n"
+    "🟢 <b>Seçilen 3 Hisse</b> (takip listesi)\n"
+    "{rows}\n"
+    "\n"
+    "🕒 <b>Saatlik Takip</b>: 11:00 • 12:00 • 13:00 • 14:00 • 15:00 • 16:00 • 17:00\n"
+    "⌨️ <code>/taipo</code> | <code>/taipo pro</code> | <code>/taipo top</code> | <code>/taipo news</code>"
+)
+
+_HOURLY_TMPL = (
+    "✅ <b>SAATLİK TAKİP</b> – TAIPO BIST v3 PRO++\n"
+    + _BOX_TOP + "\n"
+    "│ 🕒 <b>TAKİP RAPORU</b>\n"
+    "│ {ts}\n"
+    + _BOX_BOTTOM + "\n"
+    "\n"
+    "{p1}\n"
+    "\n"
+    "{p2}\n"
+    "\n"
+    "⌨️ <code>/taipo</code>"
+)
+
+_EOD_TMPL = (
+    "🏁 <b>GÜN SONU RAPORU</b> – TAIPO BIST v3 PRO++\n"
+    + _BOX_TOP + "\n"
+    "│ 🔔 <b>KAPANIŞ / TAKİP ÖZETİ</b>\n"
+    "│ {ts} (TR)\n"
+    + _BOX_BOTTOM + "\n"
+    "\n"
+    "{p1}\n"
+    "\n"
+    "{p2}\n"
+    "\n"
+    "{movers}\n"
+    "\n"
+    "⌨️ <code>/taipo</code> | <code>/taipo pro</code> | <code>/taipo top</code> | <code>/taipo news</code>"
+)
+
+_ALERT_TMPL = (
+    "🚨 <b>HAREKET ALARMI</b> (TAIPO)\n"
+    "🕒 {ts}\n"
+    "\n"
+    "{rows}"
+)
+
+HELP_MSG = (
+    "🧭 <b>TAIPO Komutlar</b>\n\n"
+    "• <code>/taipo</code> → PRO özet (movers + haber)\n"
+    "• <code>/taipo pro</code> → PRO detay (P1+P2 takip + movers + haber)\n"
+    "• <code>/taipo top</code> → sadece movers\n"
+    "• <code>/taipo news</code> → sadece haber\n"
+    "• <code>/ping</code> → test\n"
+    "• <code>/id</code> → chat id\n"
+)
+
+def _vr_txt(q: dict) -> str:
+    vr = q.get("vol_ratio")
+    return f" • hacim x{vr:.2f}" if isinstance(vr, (int, float)) else ""
+
+def _mover_rows(pairs) -> str:
+    # (mover, cp) çiftlerinden satırlar tek generator ile; ara liste yok
+    return "\n".join(
+        f"• <code>{clean_sym(m['symbol'])}</code> {m['price']:.2f}  {_TREND[cp >= 0]} {cp:+.2f}%  | 🧠Skor {m.get('score', 0):.2f}{_vr_txt(m)}"
+        for m, cp in pairs
+    )
 
-def pct_str(pct: float):
-    return f"+{pct:.2f}%" if pct >= 0 else f"{pct:.2f}%"
+def _prep_movers(movers) -> list:
+    # change_pct bir kez float'a çevrilir; alarm, sayım, sıralama ve satırlar aynı (mover, cp) listesini kullanır
+    return [(m, float(m.get("change_pct", 0) or 0.0)) for m in movers or ()]
 
-def build_movers_block(movers, top_n=5):
-    if not movers:
+def build_movers_block(enriched, top_n=5):
+    # enriched: _prep_movers çıktısı
+    if not enriched:
         return "⚠️ Movers verisi alınamadı."
 
-    pos = sum(1 for m in movers if float(m.get("change_pct", 0)) > 0)
-    neg = sum(1 for m in movers if float(m.get("change_pct", 0)) < 0)
-    flat = len(movers) - pos - neg
-
-    movers_sorted = sorted(movers, key=lambda x: float(x.get("change_pct", 0)), reverse=True)
-    top = movers_sorted[:top_n]
-    bottom = list(reversed(movers_sorted[-top_n:]))
-
-    lines = []
-    lines.append("┌──────────────────────────────")
-    lines.append("│ 📌 <b>MARKET ÖZET</b>")
-    lines.append(f"│ 🟢 Artıda: <b>{pos}</b>  🔴 Ekside: <b>{neg}</b>  ⚪️ Yatay: <b>{flat}</b>")
-    lines.append("└──────────────────────────────")
-    lines.append("")
-    lines.append("📈 <b>En Çok Yükselen 5</b>")
-    for m in top:
-        sym = clean_sym(m["symbol"])
-        vr = m.get("vol_ratio")
-        vr_txt = f" • hacim x{vr:.2f}" if isinstance(vr, (int, float)) else ""
-        lines.append(f"• <code>{sym}</code> {m['price']:.2f}  {trend_emoji(m['change_pct'])} {pct_str(m['change_pct'])}  | 🧠Skor {m.get('score', 0):.2f}{vr_txt}")
-
-    lines.append("")
-    lines.append("📉 <b>En Çok Düşen 5</b>")
-    for m in bottom:
-        sym = clean_sym(m["symbol"])
-        vr = m.get("vol_ratio")
-        vr_txt = f" • hacim x{vr:.2f}" if isinstance(vr, (int, float)) else ""
-        lines.append(f"• <code>{sym}</code> {m['price']:.2f}  {trend_emoji(m['change_pct'])} {pct_str(m['change_pct'])}  | 🧠Skor {m.get('score', 0):.2f}{vr_txt}")
+    pos = sum(1 for _, cp in enriched if cp > 0)
+    neg = sum(1 for _, cp in enriched if cp < 0)
+    flat = len(enriched) - pos - neg
 
-    return "\n".join(lines)
+    # tam sıralama yerine k-elemanlı heap; ters girişle eşitlikte eski sıralı dilimle aynı sonuç
+    top = heapq.nlargest(top_n, enriched, key=lambda t: t[1])
+    bottom = heapq.nsmallest(top_n, reversed(enriched), key=lambda t: t[1])
+
+    return _MOVERS_TMPL.format(
+        pos=pos,
+        neg=neg,
+        flat=flat,
+        top_lines=_mover_rows(top),
+        bottom_lines=_mover_rows(bottom),
+    )
 
 def build_pick_message(window_label: str, picks, picked_at, band_used):
     lo, hi = band_used
-    lines = []
-    lines.append(f"✅ <b>{window_label} KIRILIM</b> – TAIPO BIST v3 PRO++")
-    lines.append("")
-    lines.append("┌──────────────────────────────")
-    lines.append("│ 📊 <b>KIRILIM RADAR</b>")
-    lines.append(f"│ {picked_at}")
-    lines.append("└──────────────────────────────")
-    lines.append("")
-    lines.append(f"🎯 <b>Band (auto):</b> {lo:.2f}% – {hi:.2f}%")
-    lines.append("")
-    lines.append("🟢 <b>Seçilen 3 Hisse</b> (takip listesi)")
-    for q in picks:
-        sym = clean_sym(q["symbol"])
-        vr = q.get("vol_ratio")
-        vr_txt = f" • hacim x{vr:.2f}" if isinstance(vr, (int, float)) else ""
-        lines.append(f"• <code>{sym}</code>  {q['price']:.2f}   {trend_emoji(q['change_pct'])}  {pct_str(q['change_pct'])}{vr_txt}")
-    lines.append("")
-    lines.append("🕒 <b>Saatlik Takip</b>: 11:00 • 12:00 • 13:00 • 14:00 • 15:00 • 16:00 • 17:00")
-    lines.append("⌨️ <code>/taipo</code> | <code>/taipo pro</code> | <code>/taipo top</code> | <code>/taipo news</code>")
-    return "\n".join(lines)
+    rows = "\n".join(
+        f"• <code>{clean_sym(q['symbol'])}</code>  {q['price']:.2f}   {_TREND[q['change_pct'] >= 0]}  {q['change_pct']:+.2f}%{_vr_txt(q)}"
+        for q in picks
+    )
+    return _PICK_TMPL.format(label=window_label, picked_at=picked_at, lo=lo, hi=hi, rows=rows)
+
+def _watch_quotes(state):
+    # P1 + P2 takip listesi tek yf.download ile
+    syms = state.get("p1", {}).get("symbols", []) + state.get("p2", {}).get("symbols", [])
+    return fetch_quotes_batch(list(dict.fromkeys(syms)))
+
+def _track_row(sym: str, baseline: dict, q) -> str:
+    if not q:
+        return f"• <code>{clean_sym(sym)}</code> → veri yok"
+    base = float(baseline.get(sym, q["prev_close"]) or q["prev_close"])
+    pct_from_base = ((float(q["price"]) - base) / base) * 100.0
+    return f"• <code>{clean_sym(sym)}</code>  {base:.2f} → {q['price']:.2f}  {_TREND[pct_from_base >= 0]} {pct_from_base:+.2f}%"
 
-def _build_track_block(label: str, watch_block: dict):
+def _build_track_block(label: str, watch_block: dict, quotes: dict):
     symbols = watch_block.get("symbols", [])
     baseline = watch_block.get("baseline", {})
     picked_at = watch_block.get("picked_at", "")
     band_used = watch_block.get("band_used", "")
 
-    lines = []
-    lines.append(f"🔶 <b>{label}</b>")
+    head = f"🔶 <b>{label}</b>"
     if picked_at:
-        lines.append(f"🎯 Seçim: {picked_at}")
+        head += f"\n🎯 Seçim: {picked_at}"
     if band_used:
-        lines.append(f"🎚️ Band: {band_used}")
+        head += f"\n🎚️ Band: {band_used}"
     if not symbols:
-        lines.append("⚠️ Bugün bu pencerede kırılım listesi oluşmadı.")
-        return "\n".join(lines)
-
-    for sym in symbols:
-        q = fetch_quote(sym)
-        if not q:
-            lines.append(f"• <code>{clean_sym(sym)}</code> → veri yok")
-            continue
-        base = float(baseline.get(sym, q["prev_close"]) or q["prev_close"])
-        pct_from_base = ((float(q["price"]) - base) / base) * 100.0
-        lines.append(f"• <code>{clean_sym(sym)}</code>  {base:.2f} → {q['price']:.2f}  {trend_emoji(pct_from_base)} {pct_str(pct_from_base)}")
-    return "\n".join(lines)
-
-def build_hourly_track_message(state):
-    lines = []
-    lines.append("✅ <b>SAATLİK TAKİP</b> – TAIPO BIST v3 PRO++")
-    lines.append("┌──────────────────────────────")
-    lines.append("│ 🕒 <b>TAKİP RAPORU</b>")
-    lines.append(f"│ {now_str_tr()}")
-    lines.append("└──────────────────────────────")
-    lines.append("")
-    lines.append(_build_track_block("Pencere 1 (10:00–10:10)", state.get("p1", {})))
-    lines.append("")
-    lines.append(_build_track_block("Pencere 2 (10:30–10:40)", state.get("p2", {})))
-    lines.append("")
-    lines.append("⌨️ <code>/taipo</code>")
-    return "\n".join(lines)
+        return head + "\n⚠️ Bugün bu pencerede kırılım listesi oluşmadı."
+
+    # toplu istekte eksik kalanlar tek tek değil, tek bir ikinci batch ile tekrar denenir
+    misses = [sym for sym in symbols if not quotes.get(sym)]
+    if misses:
+        quotes = {**quotes, **fetch_quotes_batch(misses)}
+    rows = "\n".join(_track_row(sym, baseline, quotes.get(sym)) for sym in symbols)
+    return f"{head}\n{rows}"
+
+def build_hourly_track_message(state, n: datetime = None):
+    quotes = _watch_quotes(state)
+    return _HOURLY_TMPL.format(
+        ts=now_str_tr(n),
+        p1=_build_track_block("Pencere 1 (10:00–10:10)", state.get("p1", {}), quotes),
+        p2=_build_track_block("Pencere 2 (10:30–10:40)", state.get("p2", {}), quotes),
+    )
 
 def build_help_message():
-    return (
-        "🧭 <b>TAIPO Komutlar</b>\n\n"
-        "• <code>/taipo</code> → PRO özet (movers + haber)\n"
-        "• <code>/taipo pro</code> → PRO detay (P1+P2 takip + movers + haber)\n"
-        "• <code>/taipo top</code> → sadece movers\n"
-        "• <code>/taipo news</code> → sadece haber\n"
-        "• <code>/ping</code> → test\n"
-        "• <code>/id</code> → chat id\n"
-    )
+    return HELP_MSG
 
 # =========================================================
 # MOVERS CACHE + ALERT + EOD
 # =========================================================
-def get_movers_cached(state, symbols):
-    now_ts = int(time.time())
+def get_movers_cached(state, symbols, now_ts: int = None):
+    now_ts = now_ts or int(time.time())
     cache = state.get("movers_cache", {}) or {}
     if cache.get("data") and (now_ts - int(cache.get("ts", 0))) <= MOVERS_CACHE_SEC:
         return state, cache["data"], True
@@ -702,87 +1079,79 @@ def get_movers_cached(state, symbols):
     state["movers_cache"] = {"ts": now_ts, "data": movers}
     return state, movers, False
 
-def maybe_send_alerts(state, movers, chat_id):
-    if not movers or not chat_id:
-        return state
+def collect_alerts(state, enriched, chat_id, n: datetime = None):
+    # alarm metni döner; gönderim run_auto'da tick'in diğer mesajıyla tek istekte yapılır
+    if not enriched or not chat_id:
+        return state, ""
 
-    now_ts = int(time.time())
+    n = n or datetime.now(TZ)
+    now_ts = int(n.timestamp())
     alerts = state.get("alerts", {}) or {}
     fired = []
 
-    for m in movers:
+    for m, cp in enriched:
         sym = m.get("symbol")
         if not sym:
             continue
-        cp = float(m.get("change_pct", 0.0) or 0.0)
         if abs(cp) < ALERT_ABS_PCT:
             continue
 
-        last_ts = int(alerts.get(sym, 0) or 0)
-        if now_ts - last_ts < ALERT_COOLDOWN_SEC:
-            continue
+        prev = alerts.get(sym)
+        if prev:
+            if not isinstance(prev, dict):  # eski biçim: sadece ts
+                prev = {"ts": prev, "last_cp": None}
+            if now_ts - int(prev.get("ts", 0) or 0) < ALERT_COOLDOWN_SEC:
+                continue
+            # histerezis: eşik çevresinde salınan hisse aynı yönde tekrar tekrar alarm üretmesin
+            last_cp = prev.get("last_cp")
+            if last_cp is not None and (cp >= 0) == (last_cp >= 0) and abs(cp - last_cp) < ALERT_HYSTERESIS_PCT:
+                continue
 
-        fired.append(m)
-        alerts[sym] = now_ts
+        fired.append((m, cp))
+        alerts[sym] = {"ts": now_ts, "last_cp": cp}
 
+    text = ""
     if fired:
-        fired_sorted = sorted(fired, key=lambda x: abs(float(x.get("change_pct", 0))), reverse=True)[:5]
-        lines = []
-        lines.append("🚨 <b>HAREKET ALARMI</b> (TAIPO)")
-        lines.append(f"🕒 {now_str_tr()}")
-        lines.append("")
-        for m in fired_sorted:
-            sym = clean_sym(m["symbol"])
-            lines.append(f"• <code>{sym}</code> {m['price']:.2f} {trend_emoji(m['change_pct'])} {pct_str(m['change_pct'])} | 🧠Skor {m.get('score', 0):.2f}")
-        send_message("\n".join(lines), chat_id=chat_id)
+        fired_sorted = heapq.nlargest(5, fired, key=lambda t: abs(t[1]))
+        rows = "\n".join(
+            f"• <code>{clean_sym(m['symbol'])}</code> {m['price']:.2f} {_TREND[cp >= 0]} {cp:+.2f}% | 🧠Skor {m.get('score', 0):.2f}"
+            for m, cp in fired_sorted
+        )
+        text = _ALERT_TMPL.format(ts=now_str_tr(n), rows=rows)
 
     state["alerts"] = alerts
-    return state
+    return state, text
 
 # ✅ YENİ: EOD mesajını daha dolu ve standart bir şablona bağladık
-def build_eod_report_message(state, movers):
-    lines = []
-    lines.append("🏁 <b>GÜN SONU RAPORU</b> – TAIPO BIST v3 PRO++")
-    lines.append("┌──────────────────────────────")
-    lines.append("│ 🔔 <b>KAPANIŞ / TAKİP ÖZETİ</b>")
-    lines.append(f"│ {now_str_tr()} (TR)")
-    lines.append("└──────────────────────────────")
-    lines.append("")
-    lines.append(_build_track_block("Pencere 1 (10:00–10:10)", state.get("p1", {})))
-    lines.append("")
-    lines.append(_build_track_block("Pencere 2 (10:30–10:40)", state.get("p2", {})))
-    lines.append("")
-    lines.append(build_movers_block(movers, MOVERS_TOP_N))
-    lines.append("")
-    lines.append("⌨️ <code>/taipo</code> | <code>/taipo pro</code> | <code>/taipo top</code> | <code>/taipo news</code>")
-    return "\n".join(lines)
+def build_eod_report_message(state, enriched, n: datetime = None):
+    quotes = _watch_quotes(state)
+    return _EOD_TMPL.format(
+        ts=now_str_tr(n),
+        p1=_build_track_block("Pencere 1 (10:00–10:10)", state.get("p1", {}), quotes),
+        p2=_build_track_block("Pencere 2 (10:30–10:40)", state.get("p2", {}), quotes),
+        movers=build_movers_block(enriched, MOVERS_TOP_N),
+    )
 
-def maybe_send_eod_report(state, chat_id, movers):
-    if not is_eod_time_now():
-        return state
-    if state.get("eod_sent_day") == today_str_tr():
-        return state
+def maybe_build_eod_report(state, enriched, n: datetime = None):
+    today = today_str_tr(n)
+    if state.get("eod_sent_day") == today:
+        return state, ""
 
-    text = build_eod_report_message(state, movers)
+    text = build_eod_report_message(state, enriched, n)
     state, text = append_news_to_text(state, text)  # haber de ekle (spam engelli, yeni olanlar)
-    send_message(text, chat_id=chat_id)
 
-    state["eod_sent_day"] = today_str_tr()
-    return state
+    state["eod_sent_day"] = today
+    return state, text
 
 # =========================================================
 # PICK (P1 / P2)
 # =========================================================
-def try_pick_window(state, symbols, which: str, start_h, start_m, end_h, end_m, label: str):
+def try_pick_window(state, symbols, which: str, label: str, n: datetime = None):
     sent_key = f"{which}_sent"
     block_key = which
 
     if state.get(sent_key):
         return state, None, None
-    if not is_weekday_tr():
-        return state, None, None
-    if not is_in_window(start_h, start_m, end_h, end_m):
-        return state, None, None
 
     quotes = scan_quotes_bulk_intraday(symbols)
     if not quotes:
@@ -797,7 +1166,7 @@ def try_pick_window(state, symbols, which: str, start_h, start_m, end_h, end_m,
 
     state[block_key]["symbols"] = watch_syms
     state[block_key]["baseline"] = baseline
-    state[block_key]["picked_at"] = now_str_tr()
+    state[block_key]["picked_at"] = now_str_tr(n)
     state[block_key]["band_used"] = f"{band[0]:.2f}%–{band[1]:.2f}%"
     state[sent_key] = True
 
@@ -807,151 +1176,167 @@ def try_pick_window(state, symbols, which: str, start_h, start_m, end_h, end_m,
 # =========================================================
 # AUTO
 # =========================================================
+def _compose(state, base_text: str, enriched):
+    # ortak kuyruk: mesaj + movers + haber
+    text = base_text + "\n\n" + build_movers_block(enriched, MOVERS_TOP_N)
+    return append_news_to_text(state, text)
+
 def run_auto(state):
-    if not in_market_session():
+    # komut dinleme long-poll'dan sonra: "şimdi" burada bir kez alınır
+    now = datetime.now(TZ)
+    if not in_market_session(now):
         return state
 
     symbols = load_symbols()
     if not symbols:
-        send_message(f"⚠️ <b>bist100.txt</b> bulunamadı veya boş.\n🕒 {now_str_tr()}")
+        send_message(f"⚠️ <b>bist100.txt</b> bulunamadı veya boş.\n🕒 {now_str_tr(now)}")
         return state
 
-    # movers + alert
-    state, movers, _ = get_movers_cached(state, symbols)
-    state = maybe_send_alerts(state, movers, TARGET_CHAT_ID)
+    # tick'in tüm metinleri toplanır, sonda tek sendMessage (gerekirse 4096'da bölünür)
+    parts = []
 
-    # P1 kırılım
-    state, msg1, _ = try_pick_window(state, symbols, "p1", P1_START_H, P1_START_M, P1_END_H, P1_END_M, "10:00–10:10 (P1)")
-    if msg1:
-        msg1 += "\n\n" + build_movers_block(movers, MOVERS_TOP_N)
-        state, msg1 = append_news_to_text(state, msg1)
-        send_message(msg1)
-        return state
+    # movers tick başına bir kez: alarm ve aşağıdaki bloklar aynı listeyi kullanır
+    state, movers, _ = get_movers_cached(state, symbols, int(now.timestamp()))
+    enriched = _prep_movers(movers)
+    state, alert_text = collect_alerts(state, enriched, TARGET_CHAT_ID, now)
+    if alert_text:
+        parts.append(alert_text)
 
-    # P2 kırılım
-    state, msg2, _ = try_pick_window(state, symbols, "p2", P2_START_H, P2_START_M, P2_END_H, P2_END_M, "10:30–10:40 (P2)")
-    if msg2:
-        msg2 += "\n\n" + build_movers_block(movers, MOVERS_TOP_N)
-        state, msg2 = append_news_to_text(state, msg2)
-        send_message(msg2)
-        return state
+    event = current_event(now)
+
+    # P1 / P2 kırılım
+    if event in PICK_LABELS:
+        state, msg, _ = try_pick_window(state, symbols, event, PICK_LABELS[event], now)
+        if msg:
+            state, text = _compose(state, msg, enriched)
+            parts.append(text)
 
     # Saatlik takip
-    if is_track_time_now() and should_send_track_now(state):
-        text = build_hourly_track_message(state)
-        text += "\n\n" + build_movers_block(movers, MOVERS_TOP_N)
-        state, text = append_news_to_text(state, text)
-        send_message(text)
-        state["last_track_sent_key"] = now_key_hour()
+    elif event == "track" and should_send_track_now(state, now):
+        state, text = _compose(state, build_hourly_track_message(state, now), enriched)
+        parts.append(text)
+        state["last_track_sent_key"] = now_key_hour(now)
 
     # ✅ EOD (daha güçlü + gecikme toleranslı)
-    state = maybe_send_eod_report(state, TARGET_CHAT_ID, movers)
+    elif event == "eod" and state.get("eod_sent_day") != today_str_tr(now):
+        state, text = maybe_build_eod_report(state, enriched, now)
+        if text:
+            parts.append(text)
 
+    if parts:
+        send_message("\n\n".join(parts))
     return state
 
 # =========================================================
 # COMMAND LISTENER
 # =========================================================
+def _cmd_ping(state, msg, cid, parts, now_ts):
+    title = msg_chat_title(msg)
+    reply = f"🏓 <b>PONG</b>\n🕒 {now_str_tr(datetime.fromtimestamp(now_ts, TZ))}"
+    if title:
+        reply += f"\n👥 <b>Grup:</b> {_escape_html(title)}"
+    send_message(reply, chat_id=cid)
+    return state
+
+def _cmd_help(state, msg, cid, parts, now_ts):
+    send_message(build_help_message(), chat_id=cid)
+    return state
+
+def _cmd_id(state, msg, cid, parts, now_ts):
+    last_ts = int(state.get("last_id_reply_ts", 0))
+    if now_ts - last_ts >= ID_COOLDOWN_SEC:
+        title = msg_chat_title(msg)
+        reply = f"🆔 <b>Chat ID:</b> <code>{cid}</code>"
+        if title:
+            reply += f"\n👥 <b>Grup:</b> {_escape_html(title)}"
+        send_message(reply, chat_id=cid)
+        state["last_id_reply_ts"] = now_ts
+    return state
+
+def _taipo_news(state, header, movers_block, n):
+    return append_news_to_text(state, header + "\n📰 <b>Haber Modu</b>")
+
+def _taipo_top(state, header, movers_block, n):
+    return state, header + "\n\n" + movers_block
+
+def _taipo_pro(state, header, movers_block, n):
+    blocks = [header, build_hourly_track_message(state, n), movers_block]
+    return append_news_to_text(state, "\n\n".join(blocks))
+
+def _taipo_default(state, header, movers_block, n):
+    blocks = [
+        header,
+        "✅ <b>Durum</b>: P1/P2 otomatik kırılım + saatlik takip + kapanış raporu aktif.",
+        movers_block,
+        "⌨️ <code>/taipo pro</code> | <code>/taipo top</code> | <code>/taipo news</code> | <code>/taipo help</code>",
+    ]
+    return append_news_to_text(state, "\n\n".join(blocks))
+
+_TAIPO_MODES = {
+    "news": _taipo_news,
+    "top": _taipo_top,
+    "pro": _taipo_pro,
+}
+
+def _cmd_taipo(state, msg, cid, parts, now_ts):
+    mode = parts[1] if len(parts) >= 2 else ""
+    if mode == "help":
+        # yardım cooldown'a takılmaz
+        return _cmd_help(state, msg, cid, parts, now_ts)
+
+    last_ts = int(state.get("last_command_reply_ts", 0))
+    if now_ts - last_ts < REPLY_COOLDOWN_SEC:
+        return state
+
+    symbols = load_symbols()
+    movers = []
+    if symbols:
+        state, movers, _ = get_movers_cached(state, symbols, now_ts)
+
+    n = datetime.fromtimestamp(now_ts, TZ)
+    header = f"🛰️ <b>TAIPO • BIST RADAR</b>\n🕒 {now_str_tr(n)}\n"
+    movers_block = build_movers_block(_prep_movers(movers), MOVERS_TOP_N)
+    state, text_out = _TAIPO_MODES.get(mode, _taipo_default)(state, header, movers_block, n)
+    send_message(text_out, chat_id=cid)
+
+    state["last_command_reply_ts"] = now_ts
+    return state
+
+# komut token'ı -> handler(state, msg, cid, parts, now_ts)
+_CMD_HANDLERS = {
+    "/ping": _cmd_ping,
+    "/help": _cmd_help,
+    "/taipohelp": _cmd_help,
+    "/id": _cmd_id,
+    "/taipo": _cmd_taipo,
+}
+
 def run_command_listener(state):
     last_update_id = int(state.get("last_update_id", 0))
     updates = get_updates(last_update_id + 1)
     max_uid = last_update_id
-
-    symbols = None
+    now_ts = int(time.time())
 
     for upd in updates:
         uid = int(upd.get("update_id", 0))
         max_uid = max(max_uid, uid)
 
+        # bayat (kesinti sonrası biriken) update'ler metin işine girmeden elenir; offset yine ilerler
         msg = extract_message(upd)
-        if not msg:
+        if not msg or not is_fresh_command(msg, now_ts):
             continue
 
         text = msg_text(msg)
-        if not text:
-            continue
-
-        if not is_target_chat(msg):
-            continue
-
-        if not is_fresh_command(msg):
+        if not text or not is_target_chat(msg):
             continue
 
-        low = text.lower().strip()
-        cid = msg_chat_id(msg)
-
-        if low.startswith("/ping"):
-            title = msg_chat_title(msg)
-            reply = f"🏓 <b>PONG</b>\n🕒 {now_str_tr()}"
-            if title:
-                reply += f"\n👥 <b>Grup:</b> {_escape_html(title)}"
-            send_message(reply, chat_id=cid)
-            continue
-
-        if low.startswith("/help") or low.startswith("/taipohelp") or low.startswith("/taipo help"):
-            send_message(build_help_message(), chat_id=cid)
-            continue
-
-        if low.startswith("/id"):
-            now_ts = int(time.time())
-            last_ts = int(state.get("last_id_reply_ts", 0))
-            if now_ts - last_ts >= ID_COOLDOWN_SEC:
-                title = msg_chat_title(msg)
-                reply = f"🆔 <b>Chat ID:</b> <code>{cid}</code>"
-                if title:
-                    reply += f"\n👥 <b>Grup:</b> {_escape_html(title)}"
-                send_message(reply, chat_id=cid)
-                state["last_id_reply_ts"] = now_ts
-            continue
-
-        if low.startswith("/taipo"):
-            now_ts = int(time.time())
-            last_ts = int(state.get("last_command_reply_ts", 0))
-            if now_ts - last_ts < REPLY_COOLDOWN_SEC:
-                continue
-
-            if symbols is None:
-                symbols = load_symbols()
-
-            parts = low.split()
-            mode = "default"
-            if len(parts) >= 2:
-                mode = parts[1].strip()
-
-            movers = []
-            if symbols:
-                state, movers, _ = get_movers_cached(state, symbols)
-
-            header = f"🛰️ <b>TAIPO • BIST RADAR</b>\n🕒 {now_str_tr()}\n"
-
-            if mode in ("news",):
-                base = header + "\n📰 <b>Haber Modu</b>"
-                state, base = append_news_to_text(state, base)
-                send_message(base, chat_id=cid)
-
-            elif mode in ("top",):
-                base = header + "\n\n" + build_movers_block(movers, MOVERS_TOP_N)
-                send_message(base, chat_id=cid)
-
-            elif mode in ("pro",):
-                blocks = [header]
-                blocks.append(build_hourly_track_message(state))
-                blocks.append(build_movers_block(movers, MOVERS_TOP_N))
-                text_out = "\n\n".join(blocks)
-                state, text_out = append_news_to_text(state, text_out)
-                send_message(text_out, chat_id=cid)
-
-            else:
-                blocks = [header]
-                blocks.append("✅ <b>Durum</b>: P1/P2 otomatik kırılım + saatlik takip + kapanış raporu aktif.")
-                blocks.append(build_movers_block(movers, MOVERS_TOP_N))
-                blocks.append("⌨️ <code>/taipo pro</code> | <code>/taipo top</code> | <code>/taipo news</code> | <code>/taipo help</code>")
-                text_out = "\n\n".join(blocks)
-                state, text_out = append_news_to_text(state, text_out)
-                send_message(text_out, chat_id=cid)
-
-            state["last_command_reply_ts"] = now_ts
+        parts = text.lower().split()
+        if not parts:
             continue
+        # grupta "/taipo@BotAdi" biçimi de gelir
+        handler = _CMD_HANDLERS.get(parts[0].split("@", 1)[0])
+        if handler:
+            state = handler(state, msg, msg_chat_id(msg), parts, now_ts)
 
     state["last_update_id"] = max_uid
     return state
@@ -959,26 +1344,26 @@ def run_command_listener(state):
 # =========================================================
 # PLAN A: Git persist state.json
 # =========================================================
-def _git_has_changes(path: str) -> bool:
-    try:
-        r = subprocess.run(["git", "status", "--porcelain", path], capture_output=True, text=True, check=False)
-        return bool(r.stdout.strip())
-    except Exception:
-        return False
-
-def persist_state_if_enabled():
-    if not PERSIST_STATE:
+_GIT_ENV = {
+    "GIT_AUTHOR_NAME": "github-actions",
+    "GIT_AUTHOR_EMAIL": "actions@github.com",
+    "GIT_COMMITTER_NAME": "github-actions",
+    "GIT_COMMITTER_EMAIL": "actions@github.com",
+}
+
+def persist_state_if_enabled(changed: bool = True):
+    # changed = maybe_save_state sonucu: dosya yazılmadıysa git status'a bile gerek yok
+    if not PERSIST_STATE or not changed:
         return
     if not os.path.exists(".git"):
         return
-    if not _git_has_changes(STATE_FILE):
-        return
     try:
-        subprocess.run(["git", "config", "user.email", "actions@github.com"], check=False)
-        subprocess.run(["git", "config", "user.name", "github-actions"], check=False)
-        subprocess.run(["git", "add", STATE_FILE], check=False)
-        subprocess.run(["git", "commit", "-m", "chore: update state"], check=False)
-        subprocess.run(["git", "push"], check=False)
+        # config yerine env; add+commit+push tek süreçte
+        subprocess.run(
+            ["sh", "-c", 'git add "$1" && git commit -m "chore: update state" && git push', "sh", STATE_FILE],
+            env={**os.environ, **_GIT_ENV},
+            check=False,
+        )
     except Exception:
         pass
 
@@ -988,6 +1373,7 @@ def persist_state_if_enabled():
 def main():
     ensure_files()
     state = load_json(STATE_FILE, {})
+    remember_state_digest(state)
     state = ensure_today_state(state)
 
     # Komut dinleme HER ZAMAN
@@ -995,15 +1381,13 @@ def main():
 
     # Sadece komut modu istenirse
     if MODE == "COMMAND":
-        save_json(STATE_FILE, state)
-        persist_state_if_enabled()
+        persist_state_if_enabled(maybe_save_state(state))
         return
 
     # AUTO (P1/P2 + saatlik + eod)
     state = run_auto(state)
 
-    save_json(STATE_FILE, state)
-    persist_state_if_enabled()
+    persist_state_if_enabled(maybe_save_state(state))
 
 if __name__ == "__main__":
     main()
@@ -4,9 +4,20 @@ from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 
 import feedparser
+import requests
+from requests.adapters import HTTPAdapter
 
 TZ = ZoneInfo("Europe/Istanbul")
 
+# RSS istekleri tek oturumdan: feed başına yeni TCP+TLS kurulmaz
+HTTP_TIMEOUT_SEC = 15
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+# investing/reuters varsayılan python-requests UA'sına 403 HTML döner; feedparser bunu sessizce 0 item yapar
+_SESSION.headers["User-Agent"] = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+)
+
 # ============================================================
 # RSS KAYNAKLARI (BIST + ekonomi genel)
 # Not: Kaynakları artırabiliriz; şimdilik stabil + hızlı olanlar
@@ -123,7 +134,9 @@ def collect_news_items(
 
     for url in RSS_FEEDS:
         try:
-            feed = feedparser.parse(url)
+            r = _SESSION.get(url, timeout=HTTP_TIMEOUT_SEC)
+            r.raise_for_status()
+            feed = feedparser.parse(r.content)
             for entry in feed.entries[:50]:
                 title = entry.get("title", "") or ""
                 link = entry.get("link", "") or ""
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main  # noqa: E402
+
+FIELDS = ("Open", "High", "Low", "Close", "Adj Close", "Volume")
+
+
+def _frame(symbols, n_rows, rng, gap_p):
+    cols = pd.MultiIndex.from_product([symbols, FIELDS])
+    data = rng.uniform(10.0, 100.0, size=(n_rows, len(cols)))
+    df = pd.DataFrame(data, index=pd.RangeIndex(n_rows), columns=cols)
+    # seyrek/duraklamış semboller: tek alan ya da bütün satır boş
+    for sym in symbols:
+        for r in range(n_rows):
+            u = rng.random()
+            if u < gap_p:
+                df.loc[r, sym] = np.nan
+            elif u < 2 * gap_p:
+                df.loc[r, (sym, FIELDS[rng.integers(len(FIELDS))])] = np.nan
+    return df
+
+
+def _baseline_intraday(symbols, intraday, daily):
+    # eski sembol döngüsü: sembol başına dropna() + iloc
+    out = []
+    for sym in symbols:
+        df_i = intraday[sym].dropna()
+        if df_i.empty:
+            continue
+        last_price = float(df_i["Close"].iloc[-1])
+        last_vol = float(df_i["Volume"].iloc[-1])
+        df_d = daily[sym].dropna()
+        prev_close = float(df_d["Close"].iloc[-2]) if len(df_d) >= 2 else None
+        avg_vol = float(df_d["Volume"].tail(10).mean()) if len(df_d) >= 5 else None
+        if prev_close in (None, 0):
+            continue
+        q = {
+            "symbol": sym,
+            "price": round(last_price, 2),
+            "prev_close": round(prev_close, 2),
+            "change_pct": round((last_price - prev_close) / prev_close * 100.0, 2),
+        }
+        if avg_vol and avg_vol > 0:
+            q["vol_ratio"] = round(last_vol / avg_vol, 2)
+        out.append(q)
+    return out
+
+
+class ScanQuotesBulkIntradayTest(unittest.TestCase):
+    def test_gaps_match_per_symbol_dropna(self):
+        rng = np.random.default_rng(7)
+        symbols = [f"S{i}.IS" for i in range(60)]
+        for gap_p in (0.0, 0.1, 0.3):
+            intraday = _frame(symbols, 30, rng, gap_p)
+            daily = _frame(symbols, main.DAILY_BARS, rng, gap_p)
+            with mock.patch.object(main.yf, "download", return_value=intraday), \
+                    mock.patch.object(main, "download_daily", return_value=daily):
+                got = main.scan_quotes_bulk_intraday(symbols)
+            self.assertEqual(got, _baseline_intraday(symbols, intraday, daily), gap_p)
+
+
+class SendRetryTest(unittest.TestCase):
+    def _send(self, exc):
+        post = mock.Mock(side_effect=exc)
+        with mock.patch.object(main, "BOT_TOKEN", "x"), \
+                mock.patch.object(main.API_SESSION, "post", post), \
+                mock.patch.object(main.time, "sleep"):
+            self.assertFalse(main.send_message("hi", chat_id="1"))
+        return post.call_count
+
+    def test_read_timeout_is_not_resent(self):
+        # istek Telegram'a ulaşmış olabilir: ikinci kez gönderilmez
+        self.assertEqual(self._send(main.requests.ReadTimeout()), 1)
+
+    def test_connection_error_is_retried(self):
+        self.assertEqual(self._send(main.requests.ConnectionError()), len(main.SEND_RETRY_DELAYS) + 1)
+
+
+class NewsSeenMigrationTest(unittest.TestCase):
+    def test_legacy_title_map_is_hashed(self):
+        # 16 karakterlik başlık da digest sanılmadan hash'lenir
+        title = "borsa güne düşüş"
+        self.assertEqual(len(title), 16)
+        seen = main._load_news_seen({main.NEWS_STATE_KEY: {"kap duyurusu": 20, title: 10}})
+        self.assertEqual(list(seen.items()), [(main._news_key(title), 10), (main._news_key("kap duyurusu"), 20)])
+
+
+class DownloadDailyDeltaTest(unittest.TestCase):
+    def test_failed_ticker_keeps_cached_bars(self):
+        rng = np.random.default_rng(3)
+        symbols = ["A.IS", "B.IS"]
+        idx = pd.date_range("2026-01-01", periods=main.DAILY_BARS + 1, freq="D")
+        full = _frame(symbols, len(idx), rng, 0.0).set_index(idx)
+        cached = full.iloc[:-1]
+        delta = full.iloc[-2:].copy()
+        delta.loc[:, "B.IS"] = np.nan  # B.IS bu turda indirilemedi
+        main._DAILY_CACHE.update(ts=0, key=(), df=None)
+        with mock.patch.object(main, "load_daily_cache", return_value=cached), \
+                mock.patch.object(main.os.path, "getmtime", return_value=0), \
+                mock.patch.object(main, "_yf_daily", return_value=delta), \
+                mock.patch.object(main, "save_daily_cache") as save:
+            daily = main.download_daily(symbols)
+        self.assertIs(save.call_args[0][0], daily)
+        self.assertEqual(len(daily), main.DAILY_BARS)
+        pd.testing.assert_frame_equal(daily["A.IS"], full["A.IS"].iloc[-main.DAILY_BARS:])
+        # önceki barlar korunur; hiç verisi olmayan yeni gün boş kalır
+        pd.testing.assert_frame_equal(daily["B.IS"].iloc[:-1], cached["B.IS"].iloc[-(main.DAILY_BARS - 1):])
+        self.assertTrue(daily["B.IS"].iloc[-1].isna().all())
+
+
+class RssConditionalGetTest(unittest.TestCase):
+    RSS = b"<rss><channel><item><title>T1</title><link>https://x/a</link></item></channel></rss>"
+
+    def setUp(self):
+        self.calls = []
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache_file = os.path.join(tmp.name, "rss_cache.json")
+        patches = [
+            mock.patch.object(main, "RSS_CACHE_FILE", self.cache_file),
+            mock.patch.object(main, "NEWS_CACHE_SEC", -1),  # her çağrıda feed'e gidilsin
+            mock.patch.object(main.NEWS_SESSION, "get", side_effect=self._get),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def _get(self, url, headers=None, timeout=None):
+        self.calls.append(dict(headers or {}))
+        r = mock.Mock(headers={"ETag": "e1"}, content=self.RSS)
+        r.status_code = 304 if (headers or {}).get("If-None-Match") == "e1" else 200
+        return r
+
+    def test_state_keeps_only_validators_and_304_reuses_side_file(self):
+        state, items = main.fetch_bist_news_items({})
+        self.assertEqual(len(items), 1)
+        self.assertEqual(state[main.RSS_CACHE_KEY][main._NEWS_QUERY_URLS[0]], {"etag": "e1", "modified": ""})
+        state, items = main.fetch_bist_news_items(state)
+        self.assertEqual(self.calls[-1], {"If-None-Match": "e1"})
+        self.assertEqual(len(items), 1)
+
+    def test_unconditional_get_without_local_entries(self):
+        # state'te doğrulayıcı var ama yan dosya yok (yeni checkout)
+        state = {main.RSS_CACHE_KEY: {u: {"etag": "e1", "modified": ""} for u in main._NEWS_QUERY_URLS}}
+        state, items = main.fetch_bist_news_items(state)
+        self.assertEqual(self.calls[-1], {})
+        self.assertEqual(len(items), 1)
+
+
+class SendRetryPolicyTest(unittest.TestCase):
+    def test_only_429_is_retried_for_post(self):
+        retry = main.API_SESSION.get_adapter("https://api.telegram.org").max_retries
+        self.assertTrue(retry.is_retry("POST", 429, has_retry_after=True))
+        for code in (500, 502, 503, 504):
+            self.assertFalse(retry.is_retry("POST", code))
+        self.assertTrue(retry.respect_retry_after_header)
+
+
+if __name__ == "__main__":
+    unittest.main()